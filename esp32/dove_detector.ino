@@ -4,6 +4,7 @@
  * 功能：
  * - 使用 I2S 麦克风持续录音
  * - 实时运行 TensorFlow Lite 模型识别斑鸠叫声
+ * - 级联检测：常驻的频带能量 + 周期性门控，触发后才运行 CNN
  * - 检测到斑鸠时，通过 WiFi 发送事件到 ESPHome/Home Assistant
  * 
  * 硬件要求：
@@ -57,6 +58,22 @@ const int MODEL_INPUT_SIZE = 16000;  // 模型输入：16000 个样本（1秒@16
 const float DETECTION_THRESHOLD = 0.7;  // 置信度阈值
 const unsigned long MIN_EVENT_INTERVAL_MS = 2000;  // 两次事件最小间隔 2 秒
 
+// 级联检测（第一级门控）
+// 每跳计算 300-1000 Hz 频带能量和包络周期性，只有门控触发时才运行 CNN
+// 设为 0 则恢复为每个窗口都运行 CNN
+#define CASCADE_MODE 1
+const int HOP_SAMPLES = 512;  // 每跳 512 个样本（32 ms）
+const int WINDOW_HOPS = SAMPLES_PER_WINDOW / HOP_SAMPLES;  // 1 秒窗口内的跳数（31）
+const float GATE_BAND_LOW_HZ = 300.0f;   // 斑鸠叫声频带下限
+const float GATE_BAND_HIGH_HZ = 1000.0f; // 斑鸠叫声频带上限
+const int GATE_PERIOD_MIN_HOPS = 6;      // 周期性搜索最小间隔（约 0.2 秒）
+const int GATE_PERIOD_MAX_HOPS = 19;     // 周期性搜索最大间隔（约 0.6 秒）
+const int GATE_COOLDOWN_HOPS = 8;        // 门控持续触发时，CNN 最多每 8 跳（约 256 ms）运行一次
+// 门控阈值：用 training/calibrate_gate.py 在训练集上标定后替换
+const float GATE_MIN_BAND_RATIO = 0.30f;   // 频带能量占总能量的最小比例
+const float GATE_MIN_BAND_DB = -60.0f;     // 频带能量下限（dB，相对满量程）
+const float GATE_MIN_PERIODICITY = 0.20f;  // 包络自相关峰值下限
+
 // ========== 全局变量 ==========
 tflite::MicroInterpreter* interpreter = nullptr;
 TfLiteTensor* input = nullptr;
@@ -67,6 +84,18 @@ const int kTensorArenaSize = 100 * 1024;  // 100KB，根据实际模型调整
 int16_t audio_buffer[SAMPLES_PER_WINDOW];
 unsigned long last_event_time = 0;
 
+// 级联门控状态
+struct Biquad {
+  float b0, b1, b2, a1, a2;
+  float z1, z2;
+};
+Biquad band_filter = {};
+float band_envelope[WINDOW_HOPS] = {0};  // 最近 1 秒每跳的频带能量
+int hops_since_invoke = GATE_COOLDOWN_HOPS;
+unsigned long gate_hops = 0;     // 统计：门控处理的跳数
+unsigned long gate_invokes = 0;  // 统计：触发 CNN 的次数
+unsigned long last_gate_report = 0;
+
 // MQTT 客户端
 WiFiClient wifiClient;
 PubSubClient mqttClient(wifiClient);
@@ -81,6 +110,9 @@ void recordAudio(int16_t* buffer, int samples);
 bool detectDove(int16_t* audio_samples);
 void sendEventToServer(float confidence, unsigned long timestamp);
 void preprocessAudio(int16_t* raw_audio, float* model_input);
+void setupBandFilter();
+bool cascadeGate(const int16_t* hop_samples, int samples);
+float periodicityScore();
 
 // ========== 初始化 ==========
 void setup() {
@@ -91,6 +123,9 @@ void setup() {
   setupWiFi();
   setupI2S();
   setupModel();
+#if CASCADE_MODE
+  setupBandFilter();
+#endif
   setupMQTT();
 
   Serial.println("系统就绪，开始监听...");
@@ -103,8 +138,32 @@ void loop() {
   }
   mqttClient.loop();  // 处理 MQTT 消息
 
+#if CASCADE_MODE
+  // 录一跳（32 ms），1 秒窗口向前滑动
+  memmove(audio_buffer, audio_buffer + HOP_SAMPLES, (SAMPLES_PER_WINDOW - HOP_SAMPLES) * sizeof(int16_t));
+  int16_t* hop = audio_buffer + SAMPLES_PER_WINDOW - HOP_SAMPLES;
+  recordAudio(hop, HOP_SAMPLES);
+  hops_since_invoke++;
+  gate_hops++;
+
+  if (millis() - last_gate_report >= 60000) {
+    Serial.printf("级联门控: %lu 跳中触发 CNN %lu 次 (%.1f%%)\n",
+                  gate_hops, gate_invokes, gate_hops ? 100.0f * gate_invokes / gate_hops : 0.0f);
+    gate_hops = 0;
+    gate_invokes = 0;
+    last_gate_report = millis();
+  }
+
+  // 第一级：门控未触发时不运行 CNN
+  if (!cascadeGate(hop, HOP_SAMPLES) || hops_since_invoke < GATE_COOLDOWN_HOPS) {
+    return;
+  }
+  hops_since_invoke = 0;
+  gate_invokes++;
+#else
   // 录音
   recordAudio(audio_buffer, SAMPLES_PER_WINDOW);
+#endif
 
   // 检测斑鸠
   if (detectDove(audio_buffer)) {
@@ -124,7 +183,9 @@ void loop() {
     }
   }
 
+#if !CASCADE_MODE
   delay(100);  // 短暂延迟，避免 CPU 过载
+#endif
 }
 
 // ========== WiFi 连接 ==========
@@ -281,6 +342,87 @@ void preprocessAudio(int16_t* raw_audio, float* model_input) {
   // 可选：计算 MFCC 或 Mel Spectrogram（如果模型需要）
 }
 
+// ========== 级联门控：频带滤波器初始化 ==========
+void setupBandFilter() {
+  // RBJ 带通滤波器（0 dB 峰值增益），中心频率取上下限的几何平均
+  // 系数公式与 training/calibrate_gate.py 一致
+  float f0 = sqrtf(GATE_BAND_LOW_HZ * GATE_BAND_HIGH_HZ);
+  float bandwidth_octaves = log2f(GATE_BAND_HIGH_HZ / GATE_BAND_LOW_HZ);
+  float w0 = 2.0f * PI * f0 / SAMPLE_RATE;
+  float alpha = sinf(w0) * sinhf(logf(2.0f) / 2.0f * bandwidth_octaves * w0 / sinf(w0));
+  float a0 = 1.0f + alpha;
+
+  band_filter.b0 = alpha / a0;
+  band_filter.b1 = 0.0f;
+  band_filter.b2 = -alpha / a0;
+  band_filter.a1 = -2.0f * cosf(w0) / a0;
+  band_filter.a2 = (1.0f - alpha) / a0;
+  band_filter.z1 = 0.0f;
+  band_filter.z2 = 0.0f;
+
+  Serial.printf("级联门控已启用: %.0f-%.0f Hz\n", GATE_BAND_LOW_HZ, GATE_BAND_HIGH_HZ);
+}
+
+// ========== 级联门控：包络周期性 ==========
+float periodicityScore() {
+  // 去均值后的频带能量包络，取指定间隔范围内归一化自相关的最大值
+  float mean = 0.0f;
+  for (int i = 0; i < WINDOW_HOPS; i++) {
+    mean += band_envelope[i];
+  }
+  mean /= WINDOW_HOPS;
+
+  float centered[WINDOW_HOPS];
+  float ac0 = 0.0f;
+  for (int i = 0; i < WINDOW_HOPS; i++) {
+    centered[i] = band_envelope[i] - mean;
+    ac0 += centered[i] * centered[i];
+  }
+  if (ac0 <= 1e-20f) {
+    return 0.0f;
+  }
+
+  float best = 0.0f;
+  for (int lag = GATE_PERIOD_MIN_HOPS; lag <= GATE_PERIOD_MAX_HOPS; lag++) {
+    float ac = 0.0f;
+    for (int i = 0; i + lag < WINDOW_HOPS; i++) {
+      ac += centered[i] * centered[i + lag];
+    }
+    if (ac / ac0 > best) {
+      best = ac / ac0;
+    }
+  }
+  return best;
+}
+
+// ========== 级联门控：第一级判断 ==========
+bool cascadeGate(const int16_t* hop_samples, int samples) {
+  // 带通滤波并计算本跳的频带能量和总能量
+  float band_energy = 0.0f;
+  float total_energy = 0.0f;
+  for (int i = 0; i < samples; i++) {
+    float x = hop_samples[i] / 32768.0f;
+    float y = band_filter.b0 * x + band_filter.z1;
+    band_filter.z1 = band_filter.b1 * x - band_filter.a1 * y + band_filter.z2;
+    band_filter.z2 = band_filter.b2 * x - band_filter.a2 * y;
+    band_energy += y * y;
+    total_energy += x * x;
+  }
+  band_energy /= samples;
+  total_energy /= samples;
+
+  // 更新包络
+  memmove(band_envelope, band_envelope + 1, (WINDOW_HOPS - 1) * sizeof(float));
+  band_envelope[WINDOW_HOPS - 1] = band_energy;
+
+  float band_ratio = band_energy / (total_energy + 1e-10f);
+  float band_db = 10.0f * log10f(band_energy + 1e-10f);
+  if (band_ratio < GATE_MIN_BAND_RATIO || band_db < GATE_MIN_BAND_DB) {
+    return false;
+  }
+  return periodicityScore() >= GATE_MIN_PERIODICITY;
+}
+
 // ========== 斑鸠检测 ==========
 bool detectDove(int16_t* audio_samples) {
   // 预处理音频
@@ -10,10 +10,47 @@ Home Assistant Webhook 处理器（Python 脚本版本）
 import sqlite3
 import json
 import os
-from datetime import datetime
+import argparse
+import threading
+from collections import deque
+from datetime import datetime, timedelta
 from pathlib import Path
 
 DB_PATH = os.getenv('DOVE_DB_PATH', '/config/dove_events.db')
+# 多设备去重时间窗口（秒）：窗口内不同设备上报的事件视为同一次叫声
+DEDUP_WINDOW_SECONDS = float(os.getenv('DOVE_DEDUP_WINDOW', '3.0'))
+
+class EventDeduplicator:
+    """
+    多设备事件去重（流式时间窗口关联）
+
+    只保存起始时间仍在窗口内的叫声，内存占用受窗口大小限制。
+    事件按时间顺序到达：窗口内若有尚未包含该设备的叫声，则并入该叫声；
+    同一设备在窗口内再次上报视为新的叫声。
+    """
+
+    def __init__(self, window_seconds=DEDUP_WINDOW_SECONDS):
+        self.window = timedelta(seconds=window_seconds)
+        self.open_calls = deque()  # 按起始时间排序的 {'start', 'row_id', 'devices'}
+
+    def match(self, timestamp, devices):
+        """返回可合并的叫声（没有则返回 None），同时淘汰窗口外的叫声"""
+        while self.open_calls and timestamp - self.open_calls[0]['start'] > self.window:
+            self.open_calls.popleft()
+        for call in self.open_calls:
+            if not set(devices) & set(call['devices']):
+                return call
+        return None
+
+    def add(self, timestamp, row_id, devices):
+        """登记一个新的叫声"""
+        call = {'start': timestamp, 'row_id': row_id, 'devices': dict(devices)}
+        self.open_calls.append(call)
+        return call
+
+_deduplicator = EventDeduplicator()
+# AppDaemon 在工作线程中并发调用 handle_webhook，匹配、写库和登记必须串行
+_dedup_lock = threading.Lock()
 
 def init_database():
     """初始化数据库"""
@@ -26,47 +63,130 @@ def init_database():
             device_id TEXT,
             species TEXT,
             confidence REAL,
+            devices TEXT,
             created_at TEXT DEFAULT CURRENT_TIMESTAMP
         )
     ''')
+    # 旧数据库补充 devices 列（JSON：{device_id: confidence}）
+    columns = [row[1] for row in cursor.execute('PRAGMA table_info(dove_events)')]
+    if 'devices' not in columns:
+        cursor.execute('ALTER TABLE dove_events ADD COLUMN devices TEXT')
+    cursor.execute('CREATE INDEX IF NOT EXISTS idx_dove_events_timestamp ON dove_events (timestamp)')
     conn.commit()
     conn.close()
 
 def handle_webhook(data):
-    """处理 webhook 数据"""
+    """处理 webhook 数据
+
+    多个设备在 DEDUP_WINDOW_SECONDS 内听到同一次叫声时只保留一行，
+    各设备的置信度记录在 devices 列，confidence 取最大值
+    """
     try:
         event_type = data.get('event_type')
         if event_type != 'dove_detected':
             return {'success': False, 'error': 'Invalid event type'}
         
-        # 写入数据库
-        conn = sqlite3.connect(DB_PATH)
-        cursor = conn.cursor()
-        cursor.execute('''
-            INSERT INTO dove_events (timestamp, device_id, species, confidence)
-            VALUES (?, ?, ?, ?)
-        ''', (
-            datetime.now().isoformat(),
-            data.get('device_id', 'unknown'),
-            data.get('species', 'dove'),
-            data.get('confidence', 0.0)
-        ))
-        conn.commit()
-        conn.close()
+        device_id = data.get('device_id', 'unknown')
+        confidence = float(data.get('confidence', 0.0))
+        
+        with _dedup_lock:
+            now = datetime.now()
+            call = _deduplicator.match(now, {device_id: confidence})
+            
+            # 写入数据库
+            conn = sqlite3.connect(DB_PATH)
+            try:
+                cursor = conn.cursor()
+                if call is not None:
+                    devices = dict(call['devices'], **{device_id: confidence})
+                    cursor.execute('''
+                        UPDATE dove_events SET devices = ?, confidence = ? WHERE id = ?
+                    ''', (json.dumps(devices), max(devices.values()), call['row_id']))
+                    if cursor.rowcount == 0:
+                        # 目标行已被重新去重或归档删除，改为新插入一行
+                        _deduplicator.open_calls.remove(call)
+                        call = None
+                    else:
+                        call['devices'] = devices
+                if call is None:
+                    cursor.execute('''
+                        INSERT INTO dove_events (timestamp, device_id, species, confidence, devices)
+                        VALUES (?, ?, ?, ?, ?)
+                    ''', (
+                        now.isoformat(),
+                        device_id,
+                        data.get('species', 'dove'),
+                        confidence,
+                        json.dumps({device_id: confidence})
+                    ))
+                    call = _deduplicator.add(now, cursor.lastrowid, {device_id: confidence})
+                conn.commit()
+            finally:
+                conn.close()
+            result = {'success': True, 'event_id': call['row_id'], 'merged': len(call['devices']) > 1}
         
-        return {'success': True}
+        return result
     except Exception as e:
         return {'success': False, 'error': str(e)}
 
+def recluster_events(window_seconds=DEDUP_WINDOW_SECONDS):
+    """按时间索引顺序扫描历史事件并重新去重（线性时间）
+
+    被合并的行删除，保留行更新 devices 和 confidence
+    """
+    conn = sqlite3.connect(DB_PATH)
+    cursor = conn.cursor()
+    deduplicator = EventDeduplicator(window_seconds)
+    merged_calls = {}
+    deleted_ids = []
+    
+    rows = cursor.execute('''
+        SELECT id, timestamp, device_id, confidence, devices
+        FROM dove_events
+        ORDER BY timestamp, id
+    ''')
+    for row_id, timestamp, device_id, confidence, devices in rows:
+        devices = json.loads(devices) if devices else {device_id or 'unknown': confidence or 0.0}
+        timestamp = datetime.fromisoformat(timestamp)
+        call = deduplicator.match(timestamp, devices)
+        if call is not None:
+            call['devices'].update(devices)
+            merged_calls[call['row_id']] = call
+            deleted_ids.append((row_id,))
+        else:
+            deduplicator.add(timestamp, row_id, devices)
+    
+    cursor.executemany(
+        'UPDATE dove_events SET devices = ?, confidence = ? WHERE id = ?',
+        [(json.dumps(call['devices']), max(call['devices'].values()), row_id)
+         for row_id, call in merged_calls.items()]
+    )
+    cursor.executemany('DELETE FROM dove_events WHERE id = ?', deleted_ids)
+    conn.commit()
+    conn.close()
+    
+    print(f"✓ 重新去重完成: 合并 {len(deleted_ids)} 条重复事件")
+    return len(deleted_ids)
+
 if __name__ == "__main__":
-    # 测试
+    parser = argparse.ArgumentParser(description='斑鸠检测事件处理')
+    parser.add_argument('--db', type=str, default=DB_PATH, help='数据库路径')
+    parser.add_argument('--recluster', action='store_true', help='对历史事件重新执行多设备去重')
+    parser.add_argument('--window', type=float, default=DEDUP_WINDOW_SECONDS, help='去重时间窗口（秒）')
+    
+    args = parser.parse_args()
+    DB_PATH = args.db
+    
     init_database()
-    test_data = {
-        'event_type': 'dove_detected',
-        'device_id': 'esp32_dove_detector_01',
-        'confidence': 0.85,
-        'timestamp': datetime.now().isoformat()
-    }
-    result = handle_webhook(test_data)
-    print(json.dumps(result, indent=2))
-
+    if args.recluster:
+        recluster_events(args.window)
+    else:
+        # 测试
+        test_data = {
+            'event_type': 'dove_detected',
+            'device_id': 'esp32_dove_detector_01',
+            'confidence': 0.85,
+            'timestamp': datetime.now().isoformat()
+        }
+        result = handle_webhook(test_data)
+        print(json.dumps(result, indent=2))
@@ -0,0 +1,191 @@
+#!/usr/bin/env python3
+"""
+斑鸠事件冷数据归档
+
+功能：
+- 将 N 天前的原始事件从 SQLite 移到按日期分区的 Parquet 文件
+- 数据库中只保留汇总统计：按小时（dove_hourly_rollups 表）和按设备每日（dove_device_rollups 表）
+- 提供带分区裁剪和列裁剪的归档读取接口，供 generate_reports.py 使用
+
+归档目录结构：
+dove_archive/
+  date=2025-06-01/
+    part-00000123.parquet
+  date=2025-06-02/
+    ...
+
+使用方法：
+python3 archive_events.py --db /config/dove_events.db --archive_dir /config/dove_archive --days 90
+
+--vacuum 会重写整个数据库文件，不适合每天执行，建议手动或每月执行一次
+
+依赖：pandas、pyarrow
+"""
+
+import os
+import json
+import sqlite3
+import argparse
+import pandas as pd
+from datetime import date, timedelta
+from pathlib import Path
+from typing import List, Optional
+
+DB_PATH = os.getenv('DOVE_DB_PATH', '/config/dove_events.db')
+ARCHIVE_DIR = os.getenv('DOVE_ARCHIVE_DIR', '/config/dove_archive')
+RETENTION_DAYS = 90  # 数据库中保留的原始事件天数
+
+def init_rollup_table(conn: sqlite3.Connection):
+    """创建汇总统计表（按小时、按设备每日）"""
+    conn.execute('''
+        CREATE TABLE IF NOT EXISTS dove_hourly_rollups (
+            date TEXT NOT NULL,
+            hour INTEGER NOT NULL,
+            call_count INTEGER NOT NULL,
+            first_call_time TEXT,
+            last_call_time TEXT,
+            max_confidence REAL,
+            PRIMARY KEY (date, hour)
+        )
+    ''')
+    # 多设备合并的叫声会计入每个参与的设备
+    conn.execute('''
+        CREATE TABLE IF NOT EXISTS dove_device_rollups (
+            date TEXT NOT NULL,
+            device_id TEXT NOT NULL,
+            call_count INTEGER NOT NULL,
+            confidence_sum REAL NOT NULL,
+            PRIMARY KEY (date, device_id)
+        )
+    ''')
+    conn.commit()
+
+def update_rollups(conn: sqlite3.Connection, df: pd.DataFrame):
+    """把一批事件累加到小时汇总表和设备汇总表"""
+    rows = []
+    for (day, hour), group in df.groupby([df['timestamp'].dt.strftime('%Y-%m-%d'), df['timestamp'].dt.hour]):
+        rows.append((
+            day,
+            int(hour),
+            len(group),
+            group['timestamp'].min().isoformat(),
+            group['timestamp'].max().isoformat(),
+            float(group['confidence'].max()),
+        ))
+    conn.executemany('''
+        INSERT INTO dove_hourly_rollups
+            (date, hour, call_count, first_call_time, last_call_time, max_confidence)
+        VALUES (?, ?, ?, ?, ?, ?)
+        ON CONFLICT (date, hour) DO UPDATE SET
+            call_count = call_count + excluded.call_count,
+            first_call_time = MIN(first_call_time, excluded.first_call_time),
+            last_call_time = MAX(last_call_time, excluded.last_call_time),
+            max_confidence = MAX(max_confidence, excluded.max_confidence)
+    ''', rows)
+
+    # 按设备汇总：devices 列为空的旧数据按 device_id / confidence 计
+    device_rows = {}
+    days = df['timestamp'].dt.strftime('%Y-%m-%d')
+    devices_column = df['devices'] if 'devices' in df.columns else [None] * len(df)
+    for day, devices, device_id, confidence in zip(days, devices_column, df['device_id'], df['confidence']):
+        devices = json.loads(devices) if isinstance(devices, str) else {device_id or 'unknown': confidence or 0.0}
+        for device, device_confidence in devices.items():
+            count, total = device_rows.get((day, device), (0, 0.0))
+            device_rows[(day, device)] = (count + 1, total + float(device_confidence or 0.0))
+    conn.executemany('''
+        INSERT INTO dove_device_rollups (date, device_id, call_count, confidence_sum)
+        VALUES (?, ?, ?, ?)
+        ON CONFLICT (date, device_id) DO UPDATE SET
+            call_count = call_count + excluded.call_count,
+            confidence_sum = confidence_sum + excluded.confidence_sum
+    ''', [(day, device, count, total) for (day, device), (count, total) in device_rows.items()])
+
+def archive_events(db_path: str = DB_PATH, archive_dir: str = ARCHIVE_DIR,
+                   retention_days: int = RETENTION_DAYS, vacuum: bool = False) -> int:
+    """
+    将 retention_days 天前的事件逐日写入归档并从数据库删除
+
+    每天先写 Parquet 文件（文件名取当天最小 id，重复运行会覆盖同一文件），
+    再在同一个事务中更新汇总表并删除原始行，中途失败可以直接重跑。
+    """
+    cutoff = (date.today() - timedelta(days=retention_days)).isoformat()
+    conn = sqlite3.connect(db_path)
+    init_rollup_table(conn)
+
+    days = [row[0] for row in conn.execute('''
+        SELECT DISTINCT substr(timestamp, 1, 10)
+        FROM dove_events
+        WHERE timestamp < ?
+        ORDER BY 1
+    ''', (cutoff,))]
+
+    total = 0
+    for day in days:
+        next_day = (date.fromisoformat(day) + timedelta(days=1)).isoformat()
+        df = pd.read_sql_query(
+            'SELECT * FROM dove_events WHERE timestamp >= ? AND timestamp < ? ORDER BY timestamp',
+            conn, params=(day, next_day)
+        )
+        if len(df) == 0:
+            continue
+        df['timestamp'] = pd.to_datetime(df['timestamp'])
+
+        partition = Path(archive_dir) / f"date={day}"
+        partition.mkdir(parents=True, exist_ok=True)
+        part_path = partition / f"part-{int(df['id'].min()):08d}.parquet"
+        tmp_path = part_path.with_suffix('.parquet.tmp')
+        df.to_parquet(tmp_path, index=False)
+        os.replace(tmp_path, part_path)
+
+        with conn:
+            update_rollups(conn, df)
+            conn.executemany('DELETE FROM dove_events WHERE id = ?', [(int(i),) for i in df['id']])
+        total += len(df)
+        print(f"  {day}: 归档 {len(df)} 条事件 -> {part_path}")
+
+    if vacuum and total > 0:
+        conn.execute('VACUUM')
+    conn.close()
+
+    print(f"✓ 归档完成: 共 {total} 条事件（{cutoff} 之前）")
+    return total
+
+def load_archived_events(start_date: date, end_date: date, archive_dir: str = ARCHIVE_DIR,
+                         columns: Optional[List[str]] = None) -> pd.DataFrame:
+    """
+    读取 [start_date, end_date) 范围内的归档事件
+
+    按目录名做分区裁剪，只打开范围内的日期分区；columns 指定时只读取这些列
+    """
+    archive_path = Path(archive_dir)
+    frames = []
+    if archive_path.exists():
+        for partition in sorted(archive_path.glob('date=*')):
+            try:
+                day = date.fromisoformat(partition.name[len('date='):])
+            except ValueError:
+                continue
+            if not (start_date <= day < end_date):
+                continue
+            for part_path in sorted(partition.glob('*.parquet')):
+                frames.append(pd.read_parquet(part_path, columns=columns))
+
+    if not frames:
+        return pd.DataFrame(columns=columns or [])
+    return pd.concat(frames, ignore_index=True)
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description='归档旧的斑鸠事件')
+    parser.add_argument('--db', type=str, default=DB_PATH, help='数据库路径')
+    parser.add_argument('--archive_dir', type=str, default=ARCHIVE_DIR, help='归档目录')
+    parser.add_argument('--days', type=int, default=RETENTION_DAYS, help='数据库中保留的天数')
+    parser.add_argument('--vacuum', action='store_true', help='归档后执行 VACUUM 压缩数据库文件（会重写整个文件，建议手动或每月执行）')
+
+    args = parser.parse_args()
+
+    archive_events(
+        db_path=args.db,
+        archive_dir=args.archive_dir,
+        retention_days=args.days,
+        vacuum=args.vacuum
+    )
@@ -30,6 +30,7 @@ from datetime import datetime, date, timedelta
 from pathlib import Path
 import argparse
 from typing import Dict, List, Tuple
+from archive_events import load_archived_events
 
 # 配置
 # 方式1：使用 Home Assistant 数据库（推荐）
@@ -37,6 +38,8 @@ HA_DB_PATH = os.getenv('HA_DB_PATH', '/config/home-assistant_v2.db')
 # 方式2：使用独立数据库（如果使用 webhook_handler.py）
 DB_PATH = os.getenv('DOVE_DB_PATH', '/config/dove_events.db')
 REPORTS_DIR = os.getenv('DOVE_REPORTS_DIR', '/config/dove_reports')
+# 冷数据归档目录（archive_events.py 生成）
+ARCHIVE_DIR = os.getenv('DOVE_ARCHIVE_DIR', '/config/dove_archive')
 LANG = 'zh_CN'  # 中文报告
 
 # 优先使用 Home Assistant 数据库
@@ -77,26 +80,35 @@ def load_events(start_date: date, end_date: date) -> pd.DataFrame:
             conn.close()
     
     # 回退到独立数据库
+    columns = ['timestamp', 'species', 'confidence']
     conn = get_db_connection()
+    # 直接比较 ISO 时间字符串，可以使用 timestamp 索引
     query = """
         SELECT timestamp, species, confidence
         FROM dove_events
-        WHERE DATE(timestamp) >= ? AND DATE(timestamp) < ?
+        WHERE timestamp >= ? AND timestamp < ?
         ORDER BY timestamp
     """
     try:
         df = pd.read_sql_query(query, conn, params=(start_date.isoformat(), end_date.isoformat()))
         conn.close()
-        
-        if len(df) == 0:
-            return pd.DataFrame(columns=['timestamp', 'species', 'confidence'])
-        
         df['timestamp'] = pd.to_datetime(df['timestamp'])
-        return df
     except Exception as e:
         print(f"从独立数据库读取失败: {e}")
         conn.close()
-        return pd.DataFrame(columns=['timestamp', 'species', 'confidence'])
+        df = pd.DataFrame(columns=columns)
+    
+    # 合并已归档的旧事件（只读取范围内的分区和需要的列）
+    try:
+        archived = load_archived_events(start_date, end_date, ARCHIVE_DIR, columns=columns)
+        if len(archived) > 0:
+            df = pd.concat([archived, df], ignore_index=True).sort_values('timestamp', ignore_index=True)
+    except Exception as e:
+        print(f"从归档读取失败: {e}")
+    
+    if len(df) == 0:
+        return pd.DataFrame(columns=columns)
+    return df
 
 def calculate_daily_stats(df: pd.DataFrame) -> Dict:
     """计算每日统计"""
@@ -338,11 +350,13 @@ if __name__ == "__main__":
                        help='目标日期 (YYYY-MM-DD)，默认今天')
     parser.add_argument('--db', type=str, default=DB_PATH, help='数据库路径')
     parser.add_argument('--output', type=str, default=REPORTS_DIR, help='报告输出目录')
+    parser.add_argument('--archive_dir', type=str, default=ARCHIVE_DIR, help='归档目录')
     
     args = parser.parse_args()
     
     DB_PATH = args.db
     REPORTS_DIR = args.output
+    ARCHIVE_DIR = args.archive_dir
     os.makedirs(REPORTS_DIR, exist_ok=True)
     
     target_date = date.today()
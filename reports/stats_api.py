@@ -0,0 +1,244 @@
+#!/usr/bin/env python3
+"""
+斑鸠叫声统计查询 API（本地 HTTP/JSON 服务）
+
+功能：
+- 按任意日期范围查询总次数、每日次数、24 小时分布、每日最早叫声时间、各设备次数
+- 查询结果放在 LRU 缓存中，仪表盘重复轮询时直接返回
+- 有新事件写入数据库时（其他连接提交后 PRAGMA data_version 变化）自动清空缓存
+- 已归档的旧数据从 dove_hourly_rollups / dove_device_rollups 汇总表读取（见 archive_events.py）
+
+接口（均为 GET，日期格式 YYYY-MM-DD，范围为 [start, end)）：
+  /stats/count        总次数
+  /stats/daily        每日次数
+  /stats/hourly       24 小时分布
+  /stats/first_calls  每日最早叫声时间
+  /stats/devices      各设备参与的叫声次数
+
+参数：
+  start / end   日期范围，end 默认明天（即包含今天）
+  days          最近 N 天（未指定 start 时使用，默认 7）
+
+使用方法：
+python3 stats_api.py --db /config/dove_events.db --port 8765
+（默认只监听 127.0.0.1；需要从其他机器访问时用 --host 0.0.0.0，注意接口没有鉴权）
+curl "http://localhost:8765/stats/hourly?days=90"
+"""
+
+import os
+import json
+import sqlite3
+import argparse
+from datetime import date, datetime, timedelta
+from functools import lru_cache
+from http.server import HTTPServer, BaseHTTPRequestHandler
+from urllib.parse import urlparse, parse_qs
+from typing import Dict, Tuple
+
+DB_PATH = os.getenv('DOVE_DB_PATH', '/config/dove_events.db')
+API_HOST = os.getenv('DOVE_API_HOST', '127.0.0.1')  # 默认只监听本机，接口没有鉴权
+API_PORT = int(os.getenv('DOVE_API_PORT', '8765'))
+CACHE_SIZE = 256
+DEFAULT_DAYS = 7
+
+_conn = None
+_data_version = None
+
+def get_db_connection() -> sqlite3.Connection:
+    """获取（复用）数据库连接"""
+    global _conn
+    if _conn is None:
+        _conn = sqlite3.connect(DB_PATH)
+    return _conn
+
+def check_data_version():
+    """数据库被其他连接修改后清空查询缓存"""
+    global _data_version
+    version = get_db_connection().execute('PRAGMA data_version').fetchone()[0]
+    if version != _data_version:
+        query_stats.cache_clear()
+        _data_version = version
+
+def has_rollups(conn: sqlite3.Connection, table: str = 'dove_hourly_rollups') -> bool:
+    """是否存在归档汇总表"""
+    row = conn.execute(
+        "SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = ?", (table,)
+    ).fetchone()
+    return row is not None
+
+def stats_count(conn: sqlite3.Connection, start: str, end: str) -> Dict:
+    """总次数"""
+    total = conn.execute(
+        'SELECT COUNT(*) FROM dove_events WHERE timestamp >= ? AND timestamp < ?', (start, end)
+    ).fetchone()[0]
+    if has_rollups(conn):
+        total += conn.execute(
+            'SELECT COALESCE(SUM(call_count), 0) FROM dove_hourly_rollups WHERE date >= ? AND date < ?',
+            (start, end)
+        ).fetchone()[0]
+    return {'total_calls': total}
+
+def stats_daily(conn: sqlite3.Connection, start: str, end: str) -> Dict:
+    """每日次数"""
+    daily = {}
+    rows = conn.execute('''
+        SELECT substr(timestamp, 1, 10) AS day, COUNT(*)
+        FROM dove_events
+        WHERE timestamp >= ? AND timestamp < ?
+        GROUP BY day
+    ''', (start, end)).fetchall()
+    if has_rollups(conn):
+        rows += conn.execute('''
+            SELECT date, SUM(call_count)
+            FROM dove_hourly_rollups
+            WHERE date >= ? AND date < ?
+            GROUP BY date
+        ''', (start, end)).fetchall()
+    for day, count in rows:
+        daily[day] = daily.get(day, 0) + count
+    return {'daily': dict(sorted(daily.items()))}
+
+def stats_hourly(conn: sqlite3.Connection, start: str, end: str) -> Dict:
+    """24 小时分布"""
+    hourly = [0] * 24
+    rows = conn.execute('''
+        SELECT CAST(substr(timestamp, 12, 2) AS INTEGER) AS hour, COUNT(*)
+        FROM dove_events
+        WHERE timestamp >= ? AND timestamp < ?
+        GROUP BY hour
+    ''', (start, end)).fetchall()
+    if has_rollups(conn):
+        rows += conn.execute('''
+            SELECT hour, SUM(call_count)
+            FROM dove_hourly_rollups
+            WHERE date >= ? AND date < ?
+            GROUP BY hour
+        ''', (start, end)).fetchall()
+    for hour, count in rows:
+        hourly[hour] += count
+    peak_hour = max(range(24), key=lambda h: hourly[h]) if any(hourly) else None
+    return {'hourly': hourly, 'peak_hour': peak_hour}
+
+def stats_first_calls(conn: sqlite3.Connection, start: str, end: str) -> Dict:
+    """每日最早叫声时间"""
+    first_calls = {}
+    rows = conn.execute('''
+        SELECT substr(timestamp, 1, 10) AS day, MIN(timestamp)
+        FROM dove_events
+        WHERE timestamp >= ? AND timestamp < ?
+        GROUP BY day
+    ''', (start, end)).fetchall()
+    if has_rollups(conn):
+        rows += conn.execute('''
+            SELECT date, MIN(first_call_time)
+            FROM dove_hourly_rollups
+            WHERE date >= ? AND date < ?
+            GROUP BY date
+        ''', (start, end)).fetchall()
+    for day, first_call in rows:
+        if day not in first_calls or first_call < first_calls[day]:
+            first_calls[day] = first_call
+    return {'first_calls': dict(sorted(first_calls.items()))}
+
+def stats_devices(conn: sqlite3.Connection, start: str, end: str) -> Dict:
+    """各设备参与的叫声次数（多设备合并的叫声会计入每个设备）"""
+    rows = conn.execute('''
+        SELECT device.key, COUNT(*), SUM(device.value)
+        FROM dove_events,
+             json_each(COALESCE(dove_events.devices, json_object(dove_events.device_id, dove_events.confidence))) AS device
+        WHERE dove_events.timestamp >= ? AND dove_events.timestamp < ?
+        GROUP BY device.key
+    ''', (start, end)).fetchall()
+    if has_rollups(conn, 'dove_device_rollups'):
+        rows += conn.execute('''
+            SELECT device_id, SUM(call_count), SUM(confidence_sum)
+            FROM dove_device_rollups
+            WHERE date >= ? AND date < ?
+            GROUP BY device_id
+        ''', (start, end)).fetchall()
+    totals = {}
+    for device_id, count, confidence_sum in rows:
+        calls, total = totals.get(device_id, (0, 0.0))
+        totals[device_id] = (calls + count, total + (confidence_sum or 0.0))
+    return {'devices': {
+        device_id: {'calls': calls, 'avg_confidence': total / calls}
+        for device_id, (calls, total) in sorted(totals.items())
+    }}
+
+QUERIES = {
+    'count': stats_count,
+    'daily': stats_daily,
+    'hourly': stats_hourly,
+    'first_calls': stats_first_calls,
+    'devices': stats_devices,
+}
+
+@lru_cache(maxsize=CACHE_SIZE)
+def query_stats(kind: str, start: str, end: str) -> bytes:
+    """执行统计查询，返回序列化后的 JSON（缓存命中时不再查询和序列化）"""
+    result = QUERIES[kind](get_db_connection(), start, end)
+    result.update({'start': start, 'end': end})
+    return json.dumps(result, ensure_ascii=False).encode('utf-8')
+
+def parse_range(params: Dict) -> Tuple[str, str]:
+    """解析查询参数中的日期范围"""
+    end = date.today() + timedelta(days=1)
+    if 'end' in params:
+        end = datetime.strptime(params['end'][0], '%Y-%m-%d').date()
+    if 'start' in params:
+        start = datetime.strptime(params['start'][0], '%Y-%m-%d').date()
+    else:
+        start = end - timedelta(days=int(params.get('days', [DEFAULT_DAYS])[0]))
+    if start >= end:
+        raise ValueError('start 必须早于 end')
+    return start.isoformat(), end.isoformat()
+
+class StatsHandler(BaseHTTPRequestHandler):
+    """统计查询请求处理"""
+
+    def send_json(self, status: int, body: bytes):
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json; charset=utf-8')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def send_error_json(self, status: int, message: str):
+        self.send_json(status, json.dumps({'error': message}, ensure_ascii=False).encode('utf-8'))
+
+    def do_GET(self):
+        url = urlparse(self.path)
+        prefix, _, kind = url.path.strip('/').partition('/')
+        if prefix != 'stats' or kind not in QUERIES:
+            self.send_error_json(404, f'未知接口: {url.path}')
+            return
+        try:
+            start, end = parse_range(parse_qs(url.query))
+        except ValueError as e:
+            self.send_error_json(400, str(e))
+            return
+        try:
+            check_data_version()
+            self.send_json(200, query_stats(kind, start, end))
+        except sqlite3.Error as e:
+            self.send_error_json(500, f'数据库查询失败: {e}')
+
+    def log_message(self, format, *args):
+        # 仪表盘轮询频繁，不输出访问日志
+        pass
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description='斑鸠叫声统计查询 API')
+    parser.add_argument('--db', type=str, default=DB_PATH, help='数据库路径')
+    parser.add_argument('--host', type=str, default=API_HOST, help='监听地址')
+    parser.add_argument('--port', type=int, default=API_PORT, help='监听端口')
+
+    args = parser.parse_args()
+    DB_PATH = args.db
+
+    server = HTTPServer((args.host, args.port), StatsHandler)
+    print(f"✓ 统计 API 已启动: http://{args.host}:{args.port}/stats/count")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        server.server_close()
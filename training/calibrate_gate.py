@@ -0,0 +1,161 @@
+#!/usr/bin/env python3
+"""
+ESP32 级联检测第一级门控标定脚本
+
+功能：
+1. 按固件中相同的方法计算每个 1 秒样本的门控特征：
+   - 300-1000 Hz 带通滤波后每跳（512 个样本）的频带能量占比和频带能量（dB）
+   - 频带能量包络的周期性（归一化自相关峰值）
+2. 网格搜索门控阈值：在召回损失不超过上限的前提下，使背景样本触发 CNN 的比例最小
+3. 输出可直接替换到 esp32/dove_detector.ino 的 GATE_* 常量
+
+召回损失按斑鸠样本中被门控拦下的比例计算；指定 --model 时，只统计 CNN 本来能检出
+（概率 >= --threshold）的斑鸠样本，即门控额外带来的召回损失。
+
+注意：这里每个样本视为一个对齐的 1 秒窗口，只要有一跳满足频带条件且整个窗口满足
+周期性条件即视为触发；设备上窗口是逐跳滑动的，结果为近似值。
+频带能量下限与麦克风增益有关，训练样本与设备录音电平差别较大时应适当放宽。
+
+使用方法：
+python3 calibrate_gate.py --train_dir data/train --max_recall_loss 0.02
+python3 calibrate_gate.py --train_dir data/train --model models/best_model.h5 --threshold 0.7
+"""
+
+import argparse
+import numpy as np
+from scipy.signal import lfilter
+
+from train_model import SAMPLE_RATE, load_audio_dataset, extract_mel_spectrogram_chunked
+from evaluate_model import ScoreModel
+
+# 以下参数与 esp32/dove_detector.ino 保持一致
+HOP_SAMPLES = 512
+GATE_BAND_LOW_HZ = 300.0
+GATE_BAND_HIGH_HZ = 1000.0
+GATE_PERIOD_MIN_HOPS = 6
+GATE_PERIOD_MAX_HOPS = 19
+
+# 阈值搜索网格
+BAND_RATIO_GRID = np.linspace(0.0, 0.9, 19)
+BAND_DB_GRID = np.arange(-90.0, -19.0, 5.0)
+PERIODICITY_GRID = np.linspace(0.0, 0.9, 19)
+
+def band_filter_coefficients(sr=SAMPLE_RATE, low=GATE_BAND_LOW_HZ, high=GATE_BAND_HIGH_HZ):
+    """RBJ 带通滤波器系数（0 dB 峰值增益），与固件 setupBandFilter() 相同"""
+    f0 = np.sqrt(low * high)
+    bandwidth_octaves = np.log2(high / low)
+    w0 = 2 * np.pi * f0 / sr
+    alpha = np.sin(w0) * np.sinh(np.log(2) / 2 * bandwidth_octaves * w0 / np.sin(w0))
+    a0 = 1 + alpha
+    b = np.array([alpha, 0.0, -alpha]) / a0
+    a = np.array([1.0, -2 * np.cos(w0) / a0, (1 - alpha) / a0])
+    return b, a
+
+def periodicity_score(envelope):
+    """envelope: (N, hops) -> 去均值包络在指定间隔范围内的归一化自相关峰值 (N,)"""
+    centered = envelope - envelope.mean(axis=1, keepdims=True)
+    ac0 = np.sum(centered ** 2, axis=1)
+    best = np.zeros(len(envelope))
+    for lag in range(GATE_PERIOD_MIN_HOPS, GATE_PERIOD_MAX_HOPS + 1):
+        ac = np.sum(centered[:, :-lag] * centered[:, lag:], axis=1)
+        best = np.maximum(best, ac / np.maximum(ac0, 1e-20))
+    return np.where(ac0 > 1e-20, best, 0.0)
+
+def gate_features(audio):
+    """
+    批量计算门控特征
+
+    audio: (N, samples) -> (频带能量占比 (N, hops), 频带能量 dB (N, hops), 周期性 (N,))
+    """
+    n_hops = audio.shape[1] // HOP_SAMPLES
+    x = audio[:, :n_hops * HOP_SAMPLES].astype(np.float64)
+    b, a = band_filter_coefficients()
+    y = lfilter(b, a, x, axis=1)
+
+    band_energy = np.mean(y.reshape(len(x), n_hops, HOP_SAMPLES) ** 2, axis=-1)
+    total_energy = np.mean(x.reshape(len(x), n_hops, HOP_SAMPLES) ** 2, axis=-1)
+    band_ratio = band_energy / (total_energy + 1e-10)
+    band_db = 10 * np.log10(band_energy + 1e-10)
+    return band_ratio, band_db, periodicity_score(band_energy)
+
+def search_thresholds(band_ratio, band_db, periodicity, positive, negative, max_recall_loss):
+    """
+    网格搜索门控阈值
+
+    对每个频带能量下限，先求每个样本满足该下限的跳中最大的能量占比，
+    再与能量占比、周期性两个网格一起广播，一次得到所有组合的召回率和背景触发率
+    """
+    best = None
+    for min_db in BAND_DB_GRID:
+        best_ratio = np.where(band_db >= min_db, band_ratio, -np.inf).max(axis=1)
+        passes = ((best_ratio[:, None, None] >= BAND_RATIO_GRID[None, :, None]) &
+                  (periodicity[:, None, None] >= PERIODICITY_GRID[None, None, :]))
+        recall = passes[positive].mean(axis=0)
+        trigger_rate = passes[negative].mean(axis=0) if negative.any() else np.zeros_like(recall)
+
+        # 不满足召回约束的组合排除
+        trigger_rate = np.where(recall >= 1 - max_recall_loss, trigger_rate, np.inf)
+        i, j = np.unravel_index(np.argmin(trigger_rate), trigger_rate.shape)
+        candidate = {
+            'min_band_db': float(min_db),
+            'min_band_ratio': float(BAND_RATIO_GRID[i]),
+            'min_periodicity': float(PERIODICITY_GRID[j]),
+            'recall': float(recall[i, j]),
+            'trigger_rate': float(trigger_rate[i, j]),
+        }
+        if best is None or (candidate['trigger_rate'], -candidate['recall']) < (best['trigger_rate'], -best['recall']):
+            best = candidate
+    return best
+
+def calibrate_gate(train_dir, max_recall_loss=0.02, model_path=None, threshold=0.7):
+    """在训练集上标定门控阈值"""
+    print("=== 标定级联门控阈值 ===")
+    audio, labels = load_audio_dataset(train_dir)
+    if not np.any(labels == 1):
+        raise ValueError("训练集中没有斑鸠样本，无法标定")
+
+    positive = labels == 1
+    negative = labels == 0
+    if model_path:
+        print("\nCNN 推理...")
+        scores = ScoreModel(model_path).predict(extract_mel_spectrogram_chunked(audio))
+        positive &= scores >= threshold
+        print(f"  CNN 检出的斑鸠样本: {np.sum(positive)} / {np.sum(labels == 1)}")
+        if not positive.any():
+            raise ValueError("CNN 没有检出任何斑鸠样本，请检查模型或阈值")
+
+    print("\n计算门控特征...")
+    band_ratio, band_db, periodicity = gate_features(audio)
+
+    best = search_thresholds(band_ratio, band_db, periodicity, positive, negative, max_recall_loss)
+    if not np.isfinite(best['trigger_rate']):
+        raise ValueError(f"没有满足召回损失 <= {max_recall_loss:.2%} 的阈值组合")
+
+    print("\n=== 标定结果 ===")
+    print(f"召回损失: {1 - best['recall']:.2%}（上限 {max_recall_loss:.2%}）")
+    print(f"背景样本触发 CNN 比例: {best['trigger_rate']:.2%}")
+    if best['trigger_rate'] > 0:
+        print(f"背景下 CNN 运行次数约减少为原来的 {best['trigger_rate']:.2%}")
+    print("\n替换 esp32/dove_detector.ino 中的门控阈值：")
+    print(f"const float GATE_MIN_BAND_RATIO = {best['min_band_ratio']:.2f}f;")
+    print(f"const float GATE_MIN_BAND_DB = {best['min_band_db']:.1f}f;")
+    print(f"const float GATE_MIN_PERIODICITY = {best['min_periodicity']:.2f}f;")
+
+    return best
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description='标定 ESP32 级联检测门控阈值')
+    parser.add_argument('--train_dir', type=str, required=True, help='训练集目录（含 dove/ 和 background/）')
+    parser.add_argument('--max_recall_loss', type=float, default=0.02, help='允许的最大召回损失（比例）')
+    parser.add_argument('--model', type=str, default=None,
+                       help='模型路径（可选，只对 CNN 能检出的斑鸠样本计算召回损失）')
+    parser.add_argument('--threshold', type=float, default=0.7, help='CNN 检测阈值（配合 --model）')
+
+    args = parser.parse_args()
+
+    calibrate_gate(
+        train_dir=args.train_dir,
+        max_recall_loss=args.max_recall_loss,
+        model_path=args.model,
+        threshold=args.threshold
+    )
@@ -0,0 +1,298 @@
+#!/usr/bin/env python3
+"""
+斑鸠识别模型评估和阈值选择脚本
+
+功能：
+1. 按 batch_size 分块流式加载测试集（test/dove + test/background）并推理，只保留每个样本的斑鸠概率
+2. 基于这些分数一次性计算所有阈值下的精确率/召回率/F1、ROC 和 PR 曲线
+3. 在纯背景长录音上统计每小时误报次数
+4. 测量单窗口推理延迟
+5. 给出推荐的 DETECTION_THRESHOLD
+
+使用方法：
+python3 evaluate_model.py \
+  --model models/best_model.h5 \
+  --test_dir data/test \
+  --background_audio raw_audio/background_long \
+  --max_false_alarms 1.0
+"""
+
+import time
+import argparse
+import numpy as np
+import pandas as pd
+import librosa
+import tensorflow as tf
+from tensorflow import keras
+from pathlib import Path
+
+from train_model import (
+    SAMPLE_RATE, DURATION,
+    list_dataset_files, load_audio_file, extract_mel_spectrogram_batch,
+)
+
+LATENCY_RUNS = 50  # 单窗口延迟测量次数
+
+# 兼容 numpy 1.x / 2.x
+_trapezoid = getattr(np, 'trapezoid', None) or np.trapz
+
+class ScoreModel:
+    """统一 Keras (.h5) 和 TensorFlow Lite (.tflite) 模型的批量打分接口"""
+
+    def __init__(self, model_path):
+        self.model_path = str(model_path)
+        self.is_tflite = self.model_path.endswith('.tflite')
+        if self.is_tflite:
+            self.interpreter = tf.lite.Interpreter(model_path=self.model_path)
+            self.interpreter.allocate_tensors()
+            self.input_index = self.interpreter.get_input_details()[0]['index']
+            self.output_index = self.interpreter.get_output_details()[0]['index']
+            self.batch_size = 1
+        else:
+            self.model = keras.models.load_model(self.model_path)
+
+    def _invoke_tflite(self, batch):
+        if len(batch) != self.batch_size:
+            self.interpreter.resize_tensor_input(self.input_index, batch.shape)
+            self.interpreter.allocate_tensors()
+            self.batch_size = len(batch)
+        self.interpreter.set_tensor(self.input_index, batch)
+        self.interpreter.invoke()
+        return self.interpreter.get_tensor(self.output_index)
+
+    def predict(self, features, batch_size=256):
+        """features: (N, n_mels, frames) -> 斑鸠概率 (N,)"""
+        features = features[..., np.newaxis].astype(np.float32)
+        if len(features) == 0:
+            return np.zeros(0, dtype=np.float32)
+        if self.is_tflite:
+            probs = np.concatenate([
+                self._invoke_tflite(features[i:i + batch_size])
+                for i in range(0, len(features), batch_size)
+            ])
+        else:
+            probs = self.model.predict(features, batch_size=batch_size, verbose=0)
+        return probs[:, 1] if probs.shape[-1] == 2 else probs[:, 0]
+
+    def measure_latency(self, features, n_runs=LATENCY_RUNS):
+        """逐个窗口推理（与 ESP32 一样 batch=1），返回延迟毫秒数组"""
+        features = features[..., np.newaxis].astype(np.float32)
+        latencies = []
+        for i in range(min(n_runs, len(features))):
+            sample = features[i:i + 1]
+            start = time.perf_counter()
+            if self.is_tflite:
+                self._invoke_tflite(sample)
+            else:
+                self.model(sample, training=False)
+            latencies.append((time.perf_counter() - start) * 1000)
+        return np.array(latencies)
+
+def threshold_sweep(scores, labels):
+    """
+    一次排序计算所有阈值下的指标
+
+    以每个不同的分数作为阈值（score >= threshold 判为斑鸠），
+    通过累加真/假阳性得到整条曲线，复杂度 O(N log N)
+    """
+    order = np.argsort(-scores, kind='mergesort')
+    sorted_scores = scores[order]
+    sorted_labels = labels[order]
+
+    tp = np.cumsum(sorted_labels == 1)
+    fp = np.cumsum(sorted_labels == 0)
+    # 同分样本只保留最后一个位置
+    last = np.r_[np.nonzero(np.diff(sorted_scores))[0], len(sorted_scores) - 1]
+    thresholds = sorted_scores[last]
+    tp = tp[last]
+    fp = fp[last]
+
+    n_pos = max(int(np.sum(labels == 1)), 1)
+    n_neg = max(int(np.sum(labels == 0)), 1)
+    precision = tp / np.maximum(tp + fp, 1)
+    recall = tp / n_pos
+    fpr = fp / n_neg
+    f1 = 2 * precision * recall / np.maximum(precision + recall, 1e-12)
+
+    roc_auc = _trapezoid(np.r_[0.0, recall], np.r_[0.0, fpr])
+    average_precision = np.sum(np.diff(np.r_[0.0, recall]) * precision)
+
+    curve = pd.DataFrame({
+        'threshold': thresholds,
+        'precision': precision,
+        'recall': recall,
+        'fpr': fpr,
+        'f1': f1,
+    })
+    return curve, roc_auc, average_precision
+
+def score_dataset(model, data_dir, batch_size=256):
+    """
+    按 batch_size 分块加载测试集、提取特征并打分，内存中只保留分数
+
+    返回 (分数 (N,), 标签 (N,), 用于延迟测量的前 LATENCY_RUNS 个特征)
+    """
+    files = list_dataset_files(data_dir)
+    scores = []
+    labels = []
+    latency_features = None
+    for i in range(0, len(files), batch_size):
+        audio = []
+        for file_path, label in files[i:i + batch_size]:
+            samples = load_audio_file(file_path)
+            if samples is not None:
+                audio.append(samples)
+                labels.append(label)
+        if not audio:
+            continue
+        features = extract_mel_spectrogram_batch(np.stack(audio))
+        if latency_features is None:
+            latency_features = features[:LATENCY_RUNS]
+        scores.append(model.predict(features, batch_size=batch_size))
+
+    if not scores:
+        return np.zeros(0, dtype=np.float32), np.array(labels), None
+    return np.concatenate(scores), np.array(labels), latency_features
+
+def score_long_recordings(model, audio_dir, batch_size=256):
+    """
+    将纯背景长录音切成与设备相同的 1 秒窗口并打分
+
+    每次只读取 batch_size 个窗口的音频并提取特征，长录音不会整段载入内存。
+    返回 (每个文件的分数序列列表, 总时长小时数)
+    """
+    window = int(SAMPLE_RATE * DURATION)
+    chunk_seconds = batch_size * DURATION
+    score_sequences = []
+    total_seconds = 0.0
+    audio_files = sorted(Path(audio_dir).glob("*.wav"))
+    for audio_file in audio_files:
+        file_seconds = librosa.get_duration(path=str(audio_file))
+        file_scores = []
+        offset = 0.0
+        while offset < file_seconds:
+            audio, _ = librosa.load(str(audio_file), sr=SAMPLE_RATE, offset=offset, duration=chunk_seconds)
+            offset += chunk_seconds
+            n_windows = len(audio) // window
+            if n_windows == 0:
+                break
+            frames = audio[:n_windows * window].reshape(n_windows, window)
+            file_scores.append(model.predict(extract_mel_spectrogram_batch(frames), batch_size=batch_size))
+        if not file_scores:
+            continue
+        scores = np.concatenate(file_scores)
+        score_sequences.append(scores)
+        total_seconds += len(scores) * DURATION
+    return score_sequences, total_seconds / 3600
+
+def false_alarms_per_hour(score_sequences, hours, thresholds):
+    """
+    计算每个阈值下每小时误报次数
+
+    连续超过阈值的窗口只算一次（与设备的最小事件间隔类似）。
+    窗口 i 在阈值 t 下触发新事件当且仅当 s[i-1] < t <= s[i]，
+    因此误报数 = #(s[i] >= t) - #(s[i-1] >= t)，对所有阈值用 searchsorted 一次算完
+    """
+    if hours == 0 or not score_sequences:
+        return np.full(len(thresholds), np.nan)
+    hi = []
+    lo = []
+    for scores in score_sequences:
+        previous = np.r_[-np.inf, scores[:-1]]
+        rising = scores > previous
+        hi.append(scores[rising])
+        lo.append(previous[rising])
+    hi = np.sort(np.concatenate(hi))
+    lo = np.sort(np.concatenate(lo))
+    count_hi = len(hi) - np.searchsorted(hi, thresholds, side='left')
+    count_lo = len(lo) - np.searchsorted(lo, thresholds, side='left')
+    return (count_hi - count_lo) / hours
+
+def recommend_threshold(curve, max_false_alarms=None, min_recall=None):
+    """在满足误报率和召回率约束的阈值中选择 F1 最高的"""
+    mask = np.ones(len(curve), dtype=bool)
+    if max_false_alarms is not None and curve['false_alarms_per_hour'].notna().any():
+        mask &= curve['false_alarms_per_hour'] <= max_false_alarms
+    if min_recall is not None:
+        mask &= curve['recall'] >= min_recall
+    if not mask.any():
+        print("警告: 没有满足约束的阈值，改为选择 F1 最高的阈值")
+        mask[:] = True
+    return curve[mask].loc[curve.loc[mask, 'f1'].idxmax()]
+
+def evaluate_model(model_path, test_dir, background_audio=None, batch_size=256,
+                   max_false_alarms=None, min_recall=None, output_csv=None):
+    """评估模型并推荐检测阈值"""
+    print("=== 评估斑鸠识别模型 ===")
+    model = ScoreModel(model_path)
+
+    print("\n分块加载测试集并推理...")
+    start = time.perf_counter()
+    scores, labels, latency_features = score_dataset(model, test_dir, batch_size=batch_size)
+    elapsed = time.perf_counter() - start
+    if len(scores) == 0:
+        raise ValueError("测试集为空，请检查数据目录")
+    print(f"  {len(scores)} 个窗口，耗时 {elapsed:.2f} 秒（含加载和特征提取，{len(scores) / max(elapsed, 1e-9):.0f} 窗口/秒）")
+
+    curve, roc_auc, average_precision = threshold_sweep(scores, labels)
+
+    hours = 0.0
+    if background_audio:
+        print("\n评估背景录音误报...")
+        score_sequences, hours = score_long_recordings(model, background_audio, batch_size=batch_size)
+        print(f"  背景录音总时长: {hours:.2f} 小时")
+        curve['false_alarms_per_hour'] = false_alarms_per_hour(score_sequences, hours, curve['threshold'].values)
+    else:
+        curve['false_alarms_per_hour'] = np.nan
+
+    latencies = model.measure_latency(latency_features)
+
+    print("\n=== 评估结果 ===")
+    print(f"ROC AUC: {roc_auc:.4f}")
+    print(f"PR AP:   {average_precision:.4f}")
+    print(f"单窗口推理延迟: 中位数 {np.median(latencies):.2f} ms, P95 {np.percentile(latencies, 95):.2f} ms")
+
+    print("\n阈值    精确率  召回率  F1      误报/小时")
+    for t in np.arange(0.5, 1.0, 0.05):
+        # 取不低于 t 的最小阈值所在行
+        candidates = curve[curve['threshold'] >= t]
+        if len(candidates) == 0:
+            break
+        row = candidates.iloc[-1]
+        print(f"{t:.2f}    {row['precision']:.4f}  {row['recall']:.4f}  {row['f1']:.4f}  {row['false_alarms_per_hour']:.2f}")
+
+    best = recommend_threshold(curve, max_false_alarms, min_recall)
+    print("\n=== 推荐阈值 ===")
+    print(f"DETECTION_THRESHOLD = {best['threshold']:.2f}")
+    print(f"  精确率: {best['precision']:.4f}, 召回率: {best['recall']:.4f}, F1: {best['f1']:.4f}")
+    if hours > 0:
+        print(f"  每小时误报: {best['false_alarms_per_hour']:.2f}")
+
+    if output_csv:
+        curve.to_csv(output_csv, index=False)
+        print(f"\n完整阈值曲线已保存: {output_csv}")
+
+    return best, curve
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description='评估斑鸠识别模型并推荐检测阈值')
+    parser.add_argument('--model', type=str, required=True, help='模型路径（.h5 或 .tflite）')
+    parser.add_argument('--test_dir', type=str, required=True, help='测试集目录（含 dove/ 和 background/）')
+    parser.add_argument('--background_audio', type=str, default=None,
+                       help='纯背景长录音目录（可选，用于统计每小时误报）')
+    parser.add_argument('--batch_size', type=int, default=256, help='推理批次大小')
+    parser.add_argument('--max_false_alarms', type=float, default=None, help='允许的每小时最大误报次数')
+    parser.add_argument('--min_recall', type=float, default=None, help='要求的最低召回率')
+    parser.add_argument('--output_csv', type=str, default=None, help='保存完整阈值曲线的 CSV 路径')
+
+    args = parser.parse_args()
+
+    evaluate_model(
+        model_path=args.model,
+        test_dir=args.test_dir,
+        background_audio=args.background_audio,
+        batch_size=args.batch_size,
+        max_false_alarms=args.max_false_alarms,
+        min_recall=args.min_recall,
+        output_csv=args.output_csv
+    )
@@ -19,6 +19,7 @@ data/
 """
 
 import os
+import time
 import numpy as np
 import tensorflow as tf
 from tensorflow import keras
@@ -27,6 +28,7 @@ import librosa
 from pathlib import Path
 from sklearn.model_selection import train_test_split
 import argparse
+from convert_model_to_c_array import convert_tflite_to_c_array
 
 # 配置参数
 SAMPLE_RATE = 16000
@@ -36,6 +38,28 @@ N_FFT = 512
 HOP_LENGTH = 256
 MODEL_INPUT_SHAPE = (N_MELS, int(SAMPLE_RATE * DURATION / HOP_LENGTH) + 1)  # (40, 63)
 
+# 在线数据增强参数（--augment）
+AUG_MIX_PROB = 0.8  # 斑鸠样本混入背景噪声的概率
+AUG_SNR_DB = (0.0, 20.0)  # 混音信噪比范围（dB）
+AUG_MAX_SHIFT = 0.2  # 最大时间平移（秒）
+AUG_GAIN_DB = (-6.0, 6.0)  # 混音前斑鸠信号的增益范围（dB）
+AUG_FREQ_MASK = 6  # SpecAugment 频率掩码最大宽度（Mel 通道数）
+AUG_TIME_MASK = 10  # SpecAugment 时间掩码最大宽度（帧数）
+AUG_NUM_MASKS = 1  # 每种掩码的数量
+FEATURE_CHUNK_SIZE = 256  # 批量提取特征时每块的样本数，限制 STFT 临时内存
+
+# 学习率基准（--cpu_perf 下按 batch_size / BASE_BATCH_SIZE 线性缩放，
+# 前 WARMUP_EPOCHS 轮从 BASE_LEARNING_RATE 逐步升到缩放后的学习率）
+BASE_LEARNING_RATE = 0.001
+BASE_BATCH_SIZE = 32
+WARMUP_EPOCHS = 3
+
+# 增量微调参数（--finetune）
+FINETUNE_LEARNING_RATE = 1e-4
+FINETUNE_EPOCHS = 10
+FINETUNE_PATIENCE = 3
+REPLAY_RATIO = 1.0  # 回放样本数 = 新样本数 × REPLAY_RATIO
+
 def load_audio_file(file_path, sr=SAMPLE_RATE, duration=DURATION):
     """加载音频文件并裁剪/填充到固定长度"""
     try:
@@ -65,34 +89,159 @@ def extract_mel_spectrogram(audio, sr=SAMPLE_RATE, n_mels=N_MELS, n_fft=N_FFT, h
     mel_spec_db = (mel_spec_db - mel_spec_db.min()) / (mel_spec_db.max() - mel_spec_db.min() + 1e-8)
     return mel_spec_db
 
-def load_dataset(data_dir):
-    """加载数据集"""
+def extract_mel_spectrogram_batch(audio_batch, sr=SAMPLE_RATE, n_mels=N_MELS, n_fft=N_FFT, hop_length=HOP_LENGTH):
+    """批量提取 Mel 频谱图特征，结果与逐个调用 extract_mel_spectrogram 一致
+
+    audio_batch: (batch, samples) -> 返回 (batch, n_mels, frames)
+    """
+    mel_spec = librosa.feature.melspectrogram(
+        y=np.asarray(audio_batch, dtype=np.float32),
+        sr=sr,
+        n_mels=n_mels,
+        n_fft=n_fft,
+        hop_length=hop_length
+    )
+    # librosa.power_to_db 的 ref/top_db 作用于整个数组，这里按样本展开计算
+    amin, top_db = 1e-10, 80.0
+    ref = mel_spec.max(axis=(-2, -1), keepdims=True)
+    mel_spec_db = 10.0 * np.log10(np.maximum(amin, mel_spec)) - 10.0 * np.log10(np.maximum(amin, ref))
+    mel_spec_db = np.maximum(mel_spec_db, mel_spec_db.max(axis=(-2, -1), keepdims=True) - top_db)
+    # 按样本归一化到 [0, 1]
+    spec_min = mel_spec_db.min(axis=(-2, -1), keepdims=True)
+    spec_max = mel_spec_db.max(axis=(-2, -1), keepdims=True)
+    return (mel_spec_db - spec_min) / (spec_max - spec_min + 1e-8)
+
+def list_dataset_files(data_dir):
+    """列出数据集中的音频文件，返回 [(文件路径, 标签)]，斑鸠 = 1，背景 = 0"""
     data_dir = Path(data_dir)
+    files = []
+    for category, label in (("dove", 1), ("background", 0)):
+        category_dir = data_dir / category
+        if category_dir.exists():
+            files.extend((str(audio_file), label) for audio_file in sorted(category_dir.glob("*.wav")))
+    return files
+
+def load_feature_files(files):
+    """加载指定的音频文件并提取 Mel 频谱图特征"""
     X = []
     y = []
-    
-    # 加载斑鸠样本
-    dove_dir = data_dir / "dove"
-    if dove_dir.exists():
-        for audio_file in dove_dir.glob("*.wav"):
-            audio = load_audio_file(str(audio_file))
-            if audio is not None:
-                mel_spec = extract_mel_spectrogram(audio)
-                X.append(mel_spec)
-                y.append(1)  # 斑鸠 = 1
-    
-    # 加载背景噪声样本
-    bg_dir = data_dir / "background"
-    if bg_dir.exists():
-        for audio_file in bg_dir.glob("*.wav"):
-            audio = load_audio_file(str(audio_file))
-            if audio is not None:
-                mel_spec = extract_mel_spectrogram(audio)
-                X.append(mel_spec)
-                y.append(0)  # 背景 = 0
-    
-    X = np.array(X)
+    for file_path, label in files:
+        audio = load_audio_file(file_path)
+        if audio is not None:
+            X.append(extract_mel_spectrogram(audio))
+            y.append(label)
+    return np.array(X), np.array(y)
+
+def extract_mel_spectrogram_chunked(audio_batch, chunk_size=FEATURE_CHUNK_SIZE):
+    """分块批量提取 Mel 频谱图，避免一次性为整个数据集分配 STFT 临时数组"""
+    if len(audio_batch) == 0:
+        return np.zeros((0,) + MODEL_INPUT_SHAPE, dtype=np.float32)
+    return np.concatenate([
+        extract_mel_spectrogram_batch(audio_batch[i:i + chunk_size])
+        for i in range(0, len(audio_batch), chunk_size)
+    ])
+
+def load_audio_dataset(data_dir):
+    """加载原始音频数据集（不提取特征），供在线数据增强使用"""
+    audio_list = []
+    y = []
+
+    for file_path, label in list_dataset_files(data_dir):
+        audio = load_audio_file(file_path)
+        if audio is not None:
+            audio_list.append(audio)
+            y.append(label)
+
+    audio_array = np.array(audio_list, dtype=np.float32).reshape(-1, int(SAMPLE_RATE * DURATION))
     y = np.array(y)
+
+    print(f"音频数据集加载完成: {len(audio_array)} 个样本")
+    print(f"  斑鸠样本: {np.sum(y == 1)}")
+    print(f"  背景样本: {np.sum(y == 0)}")
+
+    return audio_array, y
+
+class AugmentedSequence(keras.utils.Sequence):
+    """按批次在线生成增强样本
+
+    每个批次在内存中即时完成：时间平移 -> 斑鸠信号随机增益后混入随机背景噪声（随机信噪比）
+    -> 批量提取 Mel 频谱图 -> SpecAugment 频率/时间掩码。
+    增强结果不落盘，也不在内存中保留整个增强数据集，每轮训练都重新采样。
+    """
+
+    def __init__(self, audio, labels, batch_size=32, seed=None):
+        super().__init__()
+        self.audio = audio
+        self.labels = labels
+        self.batch_size = batch_size
+        self.rng = np.random.default_rng(seed)
+        # 背景噪声池直接取训练集的 background/ 样本
+        self.background = audio[labels == 0]
+        self.indices = np.arange(len(audio))
+        self.rng.shuffle(self.indices)
+
+    def __len__(self):
+        return int(np.ceil(len(self.indices) / self.batch_size))
+
+    def on_epoch_end(self):
+        self.rng.shuffle(self.indices)
+
+    def __getitem__(self, idx):
+        batch_idx = self.indices[idx * self.batch_size:(idx + 1) * self.batch_size]
+        audio = self.augment_audio(self.audio[batch_idx], self.labels[batch_idx])
+        features = self.spec_augment(extract_mel_spectrogram_batch(audio))
+        return features[..., np.newaxis], keras.utils.to_categorical(self.labels[batch_idx], 2)
+
+    def augment_audio(self, audio, labels):
+        """波形级增强：时间平移、增益、背景混音"""
+        batch, n_samples = audio.shape
+        rng = self.rng
+
+        # 时间平移（空出部分补零）
+        max_shift = int(AUG_MAX_SHIFT * SAMPLE_RATE)
+        shifts = rng.integers(-max_shift, max_shift + 1, size=(batch, 1))
+        src = np.arange(n_samples)[np.newaxis, :] - shifts
+        valid = (src >= 0) & (src < n_samples)
+        audio = np.where(valid, np.take_along_axis(audio, np.clip(src, 0, n_samples - 1), axis=1), 0.0)
+
+        # 斑鸠样本按随机信噪比混入背景噪声
+        # 噪声按增益前的信号功率缩放，再对斑鸠信号施加随机增益：
+        # 特征按样本归一化，整体增益会被抵消，只有改变信号与噪声的相对电平才影响特征
+        if len(self.background) > 0:
+            mix = (labels == 1) & (rng.random(batch) < AUG_MIX_PROB)
+            noise = self.background[rng.integers(len(self.background), size=batch)]
+            snr_db = rng.uniform(*AUG_SNR_DB, size=batch)
+            signal_power = np.mean(audio ** 2, axis=1)
+            noise_power = np.mean(noise ** 2, axis=1) + 1e-10
+            scale = np.sqrt(signal_power / (noise_power * 10.0 ** (snr_db / 10.0)))
+            gain = 10.0 ** (rng.uniform(*AUG_GAIN_DB, size=batch) / 20.0)
+            audio = (np.where(mix, gain, 1.0)[:, np.newaxis] * audio +
+                     np.where(mix, scale, 0.0)[:, np.newaxis] * noise)
+
+        return np.clip(audio, -1.0, 1.0).astype(np.float32)
+
+    def spec_augment(self, features):
+        """SpecAugment：随机遮挡频率通道和时间帧"""
+        batch, n_mels, n_frames = features.shape
+        rng = self.rng
+        mask = np.zeros_like(features, dtype=bool)
+
+        for _ in range(AUG_NUM_MASKS):
+            width = rng.integers(0, AUG_FREQ_MASK + 1, size=(batch, 1, 1))
+            start = rng.integers(0, n_mels - width + 1)
+            mel_idx = np.arange(n_mels)[np.newaxis, :, np.newaxis]
+            mask |= (mel_idx >= start) & (mel_idx < start + width)
+
+            width = rng.integers(0, AUG_TIME_MASK + 1, size=(batch, 1, 1))
+            start = rng.integers(0, n_frames - width + 1)
+            frame_idx = np.arange(n_frames)[np.newaxis, np.newaxis, :]
+            mask |= (frame_idx >= start) & (frame_idx < start + width)
+
+        return np.where(mask, 0.0, features).astype(np.float32)
+
+def load_dataset(data_dir):
+    """加载数据集"""
+    X, y = load_feature_files(list_dataset_files(data_dir))
     
     print(f"数据集加载完成: {len(X)} 个样本")
     print(f"  斑鸠样本: {np.sum(y == 1)}")
@@ -134,13 +283,124 @@ def build_model(input_shape):
     
     return model
 
-def train_model(train_dir, val_dir=None, epochs=50, batch_size=32, output_dir="models"):
-    """训练模型"""
+def export_tflite(model, output_dir):
+    """转换为 TensorFlow Lite 格式并保存，返回文件路径"""
+    print("\n转换为 TensorFlow Lite...")
+    converter = tf.lite.TFLiteConverter.from_keras_model(model)
+    converter.optimizations = [tf.lite.Optimize.DEFAULT]  # 量化优化，减小模型大小
+    tflite_model = converter.convert()
+    
+    tflite_path = os.path.join(output_dir, 'dove_detector.tflite')
+    with open(tflite_path, 'wb') as f:
+        f.write(tflite_model)
+    
+    print(f"TensorFlow Lite 模型已保存: {tflite_path}")
+    print(f"模型大小: {len(tflite_model) / 1024:.2f} KB")
+    return tflite_path
+
+def configure_cpu_threads(num_threads=None):
+    """按可用 CPU 核数设置 TensorFlow 线程池（必须在 TensorFlow 执行任何运算之前调用）"""
+    if num_threads is None:
+        if hasattr(os, 'sched_getaffinity'):
+            num_threads = len(os.sched_getaffinity(0))
+        else:
+            num_threads = os.cpu_count() or 1
+    tf.config.threading.set_intra_op_parallelism_threads(num_threads)
+    tf.config.threading.set_inter_op_parallelism_threads(min(2, num_threads))
+    print(f"CPU 线程池: intra_op={num_threads}, inter_op={min(2, num_threads)}")
+    return num_threads
+
+class ThroughputCallback(keras.callbacks.Callback):
+    """
+    统计每轮训练吞吐量（样本/秒）
+
+    只计时训练步骤（从每轮开始到验证开始），样本数按实际执行的步数 × batch_size 计算，
+    丢弃不完整最后一批时不会高估
+    """
+
+    def __init__(self, n_samples, batch_size):
+        super().__init__()
+        self.n_samples = n_samples
+        self.batch_size = batch_size
+        self.rates = []
+        self.epoch_start = None
+
+    def on_epoch_begin(self, epoch, logs=None):
+        self.steps = 0
+        self.train_seconds = None
+        self.epoch_start = time.perf_counter()
+
+    def on_train_batch_end(self, batch, logs=None):
+        self.steps += 1
+
+    def on_test_begin(self, logs=None):
+        if self.epoch_start is not None and self.train_seconds is None:
+            self.train_seconds = time.perf_counter() - self.epoch_start
+
+    def on_epoch_end(self, epoch, logs=None):
+        if self.train_seconds is None:
+            self.train_seconds = time.perf_counter() - self.epoch_start
+        # 不丢弃最后一批时，最后一批可能不满 batch_size
+        samples = min(self.steps * self.batch_size, self.n_samples)
+        rate = samples / self.train_seconds
+        self.rates.append(rate)
+        print(f" - 吞吐量: {rate:.0f} 样本/秒")
+
+    def on_train_end(self, logs=None):
+        # 第一轮包含图编译时间，不计入平均值
+        steady = self.rates[1:] or self.rates
+        if steady:
+            print(f"平均训练吞吐量: {np.mean(steady):.0f} 样本/秒")
+
+class WarmupCallback(keras.callbacks.Callback):
+    """
+    学习率线性预热：前 warmup_epochs 轮内逐步从 start_lr 升到 target_lr
+
+    大批次线性缩放后的学习率直接用于 Adam 时，前几步容易发散。
+    预热结束后不再修改学习率，之后交给 ReduceLROnPlateau 调整（其 patience 大于预热轮数）
+    """
+
+    def __init__(self, target_lr, start_lr=BASE_LEARNING_RATE, warmup_epochs=WARMUP_EPOCHS):
+        super().__init__()
+        self.target_lr = target_lr
+        self.start_lr = start_lr
+        self.warmup_epochs = warmup_epochs
+        self.epoch = 0
+
+    def on_epoch_begin(self, epoch, logs=None):
+        self.epoch = epoch
+
+    def on_train_batch_begin(self, batch, logs=None):
+        if self.epoch >= self.warmup_epochs:
+            return
+        steps = self.params.get('steps') or 1
+        progress = min((self.epoch * steps + batch + 1) / (self.warmup_epochs * steps), 1.0)
+        self.model.optimizer.learning_rate.assign(self.start_lr + (self.target_lr - self.start_lr) * progress)
+
+def train_model(train_dir, val_dir=None, epochs=50, batch_size=32, output_dir="models", augment=False,
+                cpu_perf=False, num_threads=None):
+    """训练模型
+
+    augment=True 时训练集保留原始音频，由 AugmentedSequence 每轮在线生成增强批次
+
+    cpu_perf=True 时启用 CPU 吞吐量模式：
+    - 按可用核数设置 TensorFlow 线程池
+    - 使用 XLA 编译训练步骤（jit_compile）
+    - 学习率按 batch_size 线性缩放，便于使用大批次；前 WARMUP_EPOCHS 轮线性预热，避免大学习率在训练初期发散
+    - 训练数据走 tf.data 缓存管道并丢弃不完整的最后一批，保持输入形状固定，
+      编译后的图在各轮之间复用，不会重新编译
+    """
     print("=== 开始训练斑鸠识别模型 ===")
     
+    if cpu_perf:
+        configure_cpu_threads(num_threads)
+    
     # 加载训练集
     print("\n加载训练集...")
-    X_train, y_train = load_dataset(train_dir)
+    if augment:
+        X_train, y_train = load_audio_dataset(train_dir)
+    else:
+        X_train, y_train = load_dataset(train_dir)
     
     if len(X_train) == 0:
         raise ValueError("训练集为空，请检查数据目录")
@@ -156,9 +416,17 @@ def train_model(train_dir, val_dir=None, epochs=50, batch_size=32, output_dir="m
         X_train, X_val, y_train, y_val = train_test_split(
             X_train, y_train, test_size=0.2, random_state=42, stratify=y_train
         )
+        if augment:
+            # 验证集不做增强，直接提取特征
+            X_val = extract_mel_spectrogram_chunked(X_val)
     
-    # 添加通道维度（CNN 需要）
-    X_train = X_train[..., np.newaxis]
+    # 在线增强：训练数据以原始音频形式交给 AugmentedSequence，不预先提取特征
+    train_sequence = None
+    if augment:
+        train_sequence = AugmentedSequence(X_train, y_train, batch_size=batch_size, seed=42)
+    else:
+        # 添加通道维度（CNN 需要）
+        X_train = X_train[..., np.newaxis]
     X_val = X_val[..., np.newaxis]
     
     # 转换为分类标签（one-hot）
@@ -167,11 +435,16 @@ def train_model(train_dir, val_dir=None, epochs=50, batch_size=32, output_dir="m
     
     # 构建模型
     print("\n构建模型...")
-    model = build_model(X_train.shape[1:])
+    model = build_model(MODEL_INPUT_SHAPE + (1,))
+    learning_rate = BASE_LEARNING_RATE
+    if cpu_perf:
+        learning_rate = BASE_LEARNING_RATE * batch_size / BASE_BATCH_SIZE
+        print(f"批次大小 {batch_size}，学习率缩放为 {learning_rate:.6f}（前 {WARMUP_EPOCHS} 轮从 {BASE_LEARNING_RATE} 线性预热）")
     model.compile(
-        optimizer=keras.optimizers.Adam(learning_rate=0.001),
+        optimizer=keras.optimizers.Adam(learning_rate=learning_rate),
         loss='categorical_crossentropy',
-        metrics=['accuracy']
+        metrics=['accuracy'],
+        jit_compile=cpu_perf
     )
     
     model.summary()
@@ -186,59 +459,212 @@ def train_model(train_dir, val_dir=None, epochs=50, batch_size=32, output_dir="m
         ),
         keras.callbacks.ReduceLROnPlateau(monitor='val_loss', factor=0.5, patience=5, min_lr=1e-6)
     ]
+    if cpu_perf:
+        if learning_rate > BASE_LEARNING_RATE:
+            callbacks.append(WarmupCallback(learning_rate))
+        callbacks.append(ThroughputCallback(len(X_train), batch_size))
     
     # 训练
     print("\n开始训练...")
-    history = model.fit(
-        X_train, y_train_cat,
-        validation_data=(X_val, y_val_cat),
-        epochs=epochs,
-        batch_size=batch_size,
-        callbacks=callbacks,
-        verbose=1
-    )
+    if train_sequence is not None:
+        history = model.fit(
+            train_sequence,
+            validation_data=(X_val, y_val_cat),
+            epochs=epochs,
+            callbacks=callbacks,
+            verbose=1
+        )
+    elif cpu_perf:
+        train_dataset = (
+            tf.data.Dataset.from_tensor_slices((X_train.astype(np.float32), y_train_cat.astype(np.float32)))
+            .cache()
+            .shuffle(len(X_train), reshuffle_each_iteration=True)
+            .batch(batch_size, drop_remainder=len(X_train) >= batch_size)
+            .prefetch(tf.data.AUTOTUNE)
+        )
+        history = model.fit(
+            train_dataset,
+            validation_data=(X_val, y_val_cat),
+            validation_batch_size=batch_size,
+            epochs=epochs,
+            callbacks=callbacks,
+            verbose=1
+        )
+    else:
+        history = model.fit(
+            X_train, y_train_cat,
+            validation_data=(X_val, y_val_cat),
+            epochs=epochs,
+            batch_size=batch_size,
+            callbacks=callbacks,
+            verbose=1
+        )
     
     # 保存最终模型
     os.makedirs(output_dir, exist_ok=True)
     model.save(os.path.join(output_dir, 'final_model.h5'))
     
     # 转换为 TensorFlow Lite
-    print("\n转换为 TensorFlow Lite...")
-    converter = tf.lite.TFLiteConverter.from_keras_model(model)
-    converter.optimizations = [tf.lite.Optimize.DEFAULT]  # 量化优化，减小模型大小
-    tflite_model = converter.convert()
-    
-    tflite_path = os.path.join(output_dir, 'dove_detector.tflite')
-    with open(tflite_path, 'wb') as f:
-        f.write(tflite_model)
-    
-    print(f"TensorFlow Lite 模型已保存: {tflite_path}")
-    print(f"模型大小: {len(tflite_model) / 1024:.2f} KB")
+    export_tflite(model, output_dir)
     
     # 评估
     print("\n=== 模型评估 ===")
-    train_loss, train_acc = model.evaluate(X_train, y_train_cat, verbose=0)
-    val_loss, val_acc = model.evaluate(X_val, y_val_cat, verbose=0)
+    if augment:
+        # 训练集为原始音频，分块提取特征后评估（不做增强），按块大小加权平均
+        chunk_results = []
+        chunk_sizes = []
+        for i in range(0, len(X_train), FEATURE_CHUNK_SIZE):
+            features = extract_mel_spectrogram_batch(X_train[i:i + FEATURE_CHUNK_SIZE])[..., np.newaxis]
+            chunk_results.append(model.evaluate(features, y_train_cat[i:i + FEATURE_CHUNK_SIZE],
+                                                batch_size=batch_size, verbose=0))
+            chunk_sizes.append(len(features))
+        train_loss, train_acc = np.average(chunk_results, axis=0, weights=chunk_sizes)
+    else:
+        train_loss, train_acc = model.evaluate(X_train, y_train_cat, batch_size=batch_size, verbose=0)
+    val_loss, val_acc = model.evaluate(X_val, y_val_cat, batch_size=batch_size, verbose=0)
     print(f"训练集准确率: {train_acc:.4f}")
     print(f"验证集准确率: {val_acc:.4f}")
     
     return model, history
 
+def finetune_model(new_dir, val_dir, replay_dir=None, base_model=None, epochs=FINETUNE_EPOCHS,
+                   batch_size=32, output_dir="models", replay_ratio=REPLAY_RATIO, header_path=None):
+    """增量微调
+
+    从已有的 best_model.h5 继续训练，训练数据只包括新样本和从旧数据集（replay_dir，必需）
+    随机抽取的回放样本（只加载抽中的文件），使用较小学习率和早停。微调后在原验证集上与原模型比较，
+    准确率和损失都没有变差时才覆盖 best_model.h5 并重新导出 .tflite 和 C 头文件。
+
+    返回 (model, history, accepted)
+    """
+    print("=== 增量微调斑鸠识别模型 ===")
+    base_model = base_model or os.path.join(output_dir, 'best_model.h5')
+    header_path = header_path or os.path.join(output_dir, 'model.h')
+    
+    if not val_dir or not Path(val_dir).exists():
+        raise ValueError("增量微调需要已有的验证集（--val_dir）")
+    if not replay_dir or not Path(replay_dir).exists():
+        raise ValueError("增量微调需要旧训练集作为回放样本来源（--replay_dir），只用新样本训练会遗忘旧数据")
+    
+    new_files = list_dataset_files(new_dir)
+    if len(new_files) == 0:
+        raise ValueError("新样本目录为空，请检查数据目录")
+    
+    # 从旧数据集抽取回放样本，避免遗忘
+    new_paths = {str(Path(file_path).resolve()) for file_path, _ in new_files}
+    candidates = [f for f in list_dataset_files(replay_dir) if str(Path(f[0]).resolve()) not in new_paths]
+    n_replay = min(len(candidates), int(len(new_files) * replay_ratio))
+    if n_replay == 0:
+        raise ValueError(f"没有从 {replay_dir} 抽到回放样本，请检查目录或 --replay_ratio")
+    rng = np.random.default_rng(42)
+    replay_files = [candidates[i] for i in rng.choice(len(candidates), n_replay, replace=False)]
+    
+    print(f"\n加载新样本 {len(new_files)} 个，回放样本 {len(replay_files)} 个...")
+    X_train, y_train = load_feature_files(new_files + replay_files)
+    print(f"  斑鸠样本: {np.sum(y_train == 1)}")
+    print(f"  背景样本: {np.sum(y_train == 0)}")
+    
+    print("\n加载验证集...")
+    X_val, y_val = load_dataset(val_dir)
+    
+    X_train = X_train[..., np.newaxis]
+    X_val = X_val[..., np.newaxis]
+    y_train_cat = keras.utils.to_categorical(y_train, 2)
+    y_val_cat = keras.utils.to_categorical(y_val, 2)
+    
+    print(f"\n加载原模型: {base_model}")
+    model = keras.models.load_model(base_model)
+    model.compile(
+        optimizer=keras.optimizers.Adam(learning_rate=FINETUNE_LEARNING_RATE),
+        loss='categorical_crossentropy',
+        metrics=['accuracy']
+    )
+    base_loss, base_acc = model.evaluate(X_val, y_val_cat, batch_size=batch_size, verbose=0)
+    print(f"原模型验证集: 损失 {base_loss:.4f}, 准确率 {base_acc:.4f}")
+    
+    # 不使用 ModelCheckpoint，避免在比较前覆盖 best_model.h5
+    callbacks = [
+        keras.callbacks.EarlyStopping(monitor='val_loss', patience=FINETUNE_PATIENCE, restore_best_weights=True)
+    ]
+    
+    print("\n开始微调...")
+    history = model.fit(
+        X_train, y_train_cat,
+        validation_data=(X_val, y_val_cat),
+        epochs=epochs,
+        batch_size=batch_size,
+        callbacks=callbacks,
+        verbose=1
+    )
+    
+    val_loss, val_acc = model.evaluate(X_val, y_val_cat, batch_size=batch_size, verbose=0)
+    print("\n=== 微调结果 ===")
+    print(f"验证集损失: {base_loss:.4f} -> {val_loss:.4f}")
+    print(f"验证集准确率: {base_acc:.4f} -> {val_acc:.4f}")
+    
+    if val_acc < base_acc or val_loss > base_loss:
+        print("验证集指标退化，保留原模型，不重新导出")
+        return model, history, False
+    
+    os.makedirs(output_dir, exist_ok=True)
+    model.save(os.path.join(output_dir, 'best_model.h5'))
+    model.save(os.path.join(output_dir, 'final_model.h5'))
+    tflite_path = export_tflite(model, output_dir)
+    convert_tflite_to_c_array(tflite_path, header_path)
+    
+    return model, history, True
+
 if __name__ == "__main__":
     parser = argparse.ArgumentParser(description='训练斑鸠识别模型')
-    parser.add_argument('--train_dir', type=str, required=True, help='训练集目录')
-    parser.add_argument('--val_dir', type=str, default=None, help='验证集目录（可选）')
-    parser.add_argument('--epochs', type=int, default=50, help='训练轮数')
+    parser.add_argument('--train_dir', type=str, required=True, help='训练集目录（--finetune 时为新样本目录）')
+    parser.add_argument('--val_dir', type=str, default=None, help='验证集目录（可选，--finetune 时必需）')
+    parser.add_argument('--epochs', type=int, default=None,
+                       help=f'训练轮数（默认 50，--finetune 时默认 {FINETUNE_EPOCHS}）')
     parser.add_argument('--batch_size', type=int, default=32, help='批次大小')
     parser.add_argument('--output_dir', type=str, default='models', help='模型输出目录')
+    parser.add_argument('--augment', action='store_true',
+                       help='启用在线数据增强（背景混音、时间平移、增益、SpecAugment）')
+    parser.add_argument('--cpu_perf', action='store_true',
+                       help='CPU 吞吐量模式（XLA 编译、线程池设置、学习率按批次缩放）')
+    parser.add_argument('--num_threads', type=int, default=None,
+                       help='CPU 线程数（默认使用全部可用核）')
+    parser.add_argument('--finetune', action='store_true',
+                       help='增量微调：从已有模型出发，只用新样本和回放样本训练')
+    parser.add_argument('--base_model', type=str, default=None,
+                       help='微调的起点模型（默认 <output_dir>/best_model.h5）')
+    parser.add_argument('--replay_dir', type=str, default=None, help='旧训练集目录，用于抽取回放样本（--finetune 时必需）')
+    parser.add_argument('--replay_ratio', type=float, default=REPLAY_RATIO, help='回放样本数与新样本数之比')
+    parser.add_argument('--header_path', type=str, default=None,
+                       help='微调通过后导出的 C 头文件路径（默认 <output_dir>/model.h）')
     
     args = parser.parse_args()
     
-    train_model(
-        train_dir=args.train_dir,
-        val_dir=args.val_dir,
-        epochs=args.epochs,
-        batch_size=args.batch_size,
-        output_dir=args.output_dir
-    )
-
+    if args.finetune:
+        if not args.replay_dir:
+            parser.error('--finetune 需要指定 --replay_dir（旧训练集，用于抽取回放样本）')
+        unsupported = [flag for flag, value in (('--augment', args.augment), ('--cpu_perf', args.cpu_perf),
+                                                ('--num_threads', args.num_threads is not None)) if value]
+        if unsupported:
+            parser.error(f"--finetune 不支持 {', '.join(unsupported)}")
+        finetune_model(
+            new_dir=args.train_dir,
+            val_dir=args.val_dir,
+            replay_dir=args.replay_dir,
+            base_model=args.base_model,
+            epochs=args.epochs or FINETUNE_EPOCHS,
+            batch_size=args.batch_size,
+            output_dir=args.output_dir,
+            replay_ratio=args.replay_ratio,
+            header_path=args.header_path
+        )
+    else:
+        train_model(
+            train_dir=args.train_dir,
+            val_dir=args.val_dir,
+            epochs=args.epochs or 50,
+            batch_size=args.batch_size,
+            output_dir=args.output_dir,
+            augment=args.augment,
+            cpu_perf=args.cpu_perf,
+            num_threads=args.num_threads
+        )